@@ -1,8 +1,100 @@
+import atexit
+import glob
+import io
+import queue
+import re
 import subprocess
+from pathlib import PurePath
 import os.path
+import shlex
+import shutil
+import stat
+import string
 import sys
+import threading
+import time
 import logging
-from configparser import ConfigParser, ExtendedInterpolation
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener
+from configparser import ConfigParser, ExtendedInterpolation, Interpolation, InterpolationError
+
+
+_executable_cache = dict()
+
+
+def _resolve_executable(name: str) -> str:
+    """
+    Resolves the absolute path of the given executable once per run (shutil.which), saving the
+    PATH scan execvp would otherwise repeat on every spawn; names which cannot be resolved are
+    passed through unchanged so the subprocess reports the actual error
+    """
+    resolved = _executable_cache.get(name)
+    if resolved is None:
+        resolved = shutil.which(name) or name
+        _executable_cache[name] = resolved
+    return resolved
+
+
+def _probe(path: str):
+    """
+    Single-stat probe of the given path.
+    Returns the stat result or None if the path does not exist - one syscall covers
+    what separate exists/isfile checks would need two or more for
+    """
+    try:
+        return os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+class BufferedStreamHandler(logging.StreamHandler):
+    """
+    StreamHandler which does not flush after every record, leaving that to the (buffered)
+    underlying stream; the caller is responsible for flushing the stream at exit
+    """
+
+    def flush(self):
+        pass
+
+
+LOG_DIR = 'x_log'
+
+# one formatter serves both handlers; built at import so init_logging only wires it up
+_LOG_FORMATTER = logging.Formatter(fmt='%(asctime)s %(name)s %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+# taken once at import, so every log file of a single run carries the same timestamp
+_LOG_TS = time.strftime('%Y%m%d%H%M%S')
+
+
+def init_logging(log_name: str) -> logging.Logger:
+    """
+    Configures logging of the installer: a 64kB-buffered file in LOG_DIR plus INFO-level stdout,
+    with the records routed through a queue so the install path never blocks on log I/O.
+    The queue listener is stopped and the file buffer flushed at interpreter exit
+    :param log_name: distinguishes the log file of the calling installer, e.g. 'wsgi'
+    """
+    os.makedirs(LOG_DIR, exist_ok=True)
+    log_file = io.TextIOWrapper(
+        open(os.path.join(LOG_DIR, f'{_LOG_TS}_{log_name}.log'),
+             'wb', buffering=64 * 1024),
+        line_buffering=False, write_through=False)
+    # atexit runs in reverse registration order: the listener drains the queue, then the flush
+    atexit.register(log_file.flush)
+    file_hdlr = BufferedStreamHandler(log_file)
+    file_hdlr.setFormatter(_LOG_FORMATTER)
+    stream_hdlr = logging.StreamHandler(sys.stdout)
+    stream_hdlr.setLevel(logging.INFO)
+    stream_hdlr.setFormatter(_LOG_FORMATTER)
+
+    record_queue = queue.SimpleQueue()
+    listener = QueueListener(record_queue, file_hdlr, stream_hdlr, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger = logging.getLogger()
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(QueueHandler(record_queue))
+    return logger
 
 
 class CommandlineConfig:
@@ -25,6 +117,14 @@ class CommandlineConfig:
 
     COMPONENT = 'commandline config'
 
+    # dispatch table: argument -> (attribute, value); O(1) lookup instead of a chain of compares
+    ARG_HANDLERS = {
+        DBTEST: ('dbtest_mode', True),
+        START: ('start_immediately', True),
+        UPDATE: ('update_only', True),
+        **{_uninstall_arg: ('install', False) for _uninstall_arg in UNINSTALL},
+    }
+
     def __init__(self):
         """
         Initializes the configuration from sys.argv
@@ -46,28 +146,24 @@ class CommandlineConfig:
             self.config_file = sys.argv[1]
 
         for arg in sys.argv[2:]:
-            if arg == CommandlineConfig.DBTEST:
-                self.dbtest_mode = True
-            elif arg in CommandlineConfig.UNINSTALL:
-                self.install = False
-            elif arg == CommandlineConfig.START:
-                self.start_immediately = True
-            elif arg == CommandlineConfig.UPDATE:
-                self.update_only = True
-            else:
+            handler = CommandlineConfig.ARG_HANDLERS.get(arg)
+            if handler is None:
                 raise InstallationException(CommandlineConfig.COMPONENT,
                                             f'Parameter not recognized: {arg}. {CommandlineConfig.USAGE}')
+            setattr(self, *handler)
 
-        if not os.path.exists(self.config_file):
+        config_stat = _probe(self.config_file)
+        if config_stat is None:
             # try to guess config
             self.config_file = f'./install/{self.config_file}.install.ini'
 
-            if not os.path.exists(self.config_file):
+            config_stat = _probe(self.config_file)
+            if config_stat is None:
                 raise InstallationException(CommandlineConfig.COMPONENT,
                                             f'Path to the file with installation configuration: {self.config_file} '
                                             f'points to an invalid location')
 
-        if not os.path.isfile(self.config_file):
+        if not stat.S_ISREG(config_stat.st_mode):
             raise InstallationException(CommandlineConfig.COMPONENT,
                                         f'Path to the file with installation configuration: {self.config_file} '
                                         f"does not point to an actual file")
@@ -77,16 +173,15 @@ class CommandlineConfig:
                                         f'Instructed both to uninstall and to start the service. '
                                         f'Make up your mind, the two options are contradicting')
 
-        try:
-            with open(self.config_file, 'r'):
-                pass
-        except PermissionError as pererr:
+        # os.access answers the permission question without the open/close round trip
+        if not os.access(self.config_file, os.R_OK):
             raise InstallationException(CommandlineConfig.COMPONENT,
                                         f'The file with installation configuration: {self.config_file} '
                                         f"cannot be opened using current security context. "
-                                        f"Try with sudo. ({str(pererr)})")
+                                        f"Try with sudo.")
 
-        self.install_config_file_name = os.path.split(os.path.splitext(self.config_file)[0])[-1]
+        # PurePath.stem parses the path once instead of the splitext/split tuple dance
+        self.install_config_file_name = PurePath(self.config_file).stem
 
 
 class InstallationException(Exception):
@@ -120,6 +215,54 @@ class InstallationComponent:
         raise InstallationException(component=self._component_name(), message=message)
 
 
+class FastIni:
+    """
+    Minimal regex-based INI reader for plain key=value files which need none of ConfigParser's
+    interpolation, defaults or type machinery (e.g. the origin service configuration).
+    Two compiled patterns cover the whole grammar; a missing file yields an empty configuration
+    """
+
+    _SECTION_RE = re.compile(r'^\s*\[([^\]]+)\]\s*$')
+    _KV_RE = re.compile(r'^\s*([^=:;#\s][^=:]*?)\s*[=:]\s*(.*?)\s*$')
+
+    def __init__(self, ini_file: str):
+        self._data = dict()
+        try:
+            with open(ini_file, 'r', encoding='utf-8') as _file:
+                content = _file.read()
+        except FileNotFoundError:
+            content = ''
+
+        section = None
+        for line in content.splitlines():
+            if not line or line.lstrip().startswith((';', '#')):
+                continue
+            matched = self._SECTION_RE.match(line)
+            if matched:
+                section = self._data.setdefault(matched.group(1), dict())
+                continue
+            matched = self._KV_RE.match(line)
+            if matched and section is not None:
+                section[matched.group(1)] = matched.group(2)
+
+    def has_section(self, section: str) -> bool:
+        return section in self._data
+
+    def has_option(self, section: str, option: str) -> bool:
+        return option in self._data.get(section, {})
+
+    def options(self, section: str) -> list:
+        return list(self._data.get(section, {}))
+
+    def get(self, section: str, option: str, fallback=None):
+        return self._data.get(section, {}).get(option, fallback)
+
+
+# ExtendedInterpolation is stateless, so all Config instances can share one object
+# (and its internally compiled placeholder regex) instead of constructing it per instance
+_EXTENDED_INTERPOLATION = ExtendedInterpolation()
+
+
 class Config(InstallationComponent, ConfigParser):
     """
     Common part of mechanism keeping parsed content of installation config
@@ -151,28 +294,110 @@ class Config(InstallationComponent, ConfigParser):
     OPTION_PASSWORD = 'password'
     OPTION_DESCRIPTION = "description"
 
+    # parsed origin service ini files, shared between instances so the file is parsed once
+    _origin_ini_cache = dict()
+
     def _component_name(self):
         return Config.COMPONENT
 
     def __init__(self, config_file):
         InstallationComponent.__init__(self)
-        ConfigParser.__init__(self, interpolation=ExtendedInterpolation(), allow_no_value=True)
+        ConfigParser.__init__(self, interpolation=_EXTENDED_INTERPOLATION, allow_no_value=True)
         self.optionxform = str  # preserves case-sensitivity
+        # kept aside so _resolve_all can re-arm interpolation for each resolution pass
+        self._extended_interpolation = self._interpolation
 
-        config_dir = os.path.dirname(config_file)
-        credentials_file = os.path.join(config_dir, Config.CREDENTIALS_FILE)
+        credentials_file = str(PurePath(config_file).parent / Config.CREDENTIALS_FILE)
 
-        if not os.path.exists(credentials_file):
+        # reading the files directly instead of probing first saves a stat per file
+        # and keeps the missing-file error free of the check-then-open race
+        try:
+            with open(credentials_file, 'r') as _file:
+                credentials_content = _file.read()
+        except FileNotFoundError:
             self.raise_exception(
                 f'The file with credentials: {credentials_file} '
                 f"does not exist")
 
-        self.read([credentials_file, config_file])
+        try:
+            with open(config_file, 'r') as _file:
+                config_content = _file.read()
+        except FileNotFoundError:
+            self.raise_exception(
+                f'The configuration file: {config_file} '
+                f"does not exist")
+
+        # separate parse passes keep the merge semantics of read([credentials, config])
+        self.read_string(credentials_content, source=credentials_file)
+        self.read_string(config_content, source=config_file)
+
+        # lazy caches; the configuration is read-only once parsed
+        self._modules_lookup_paths = None
+        self._database_credentials = None
+        self._path_origin_service_ini = None
+        self._path_service_env_ini = None
+        self._path_systemd = None
+
+        self._resolved = dict()
+        self._resolve_all()
+
+    def _resolve_all(self):
+        """
+        Walks all parsed sections once and stores the fully-interpolated values, so subsequent
+        lookups are plain dictionary hits instead of interpolation passes through ConfigParser.
+        Must be invoked again whenever additional files are merged in (see ServiceConfig) - options
+        referencing not-yet-read files are skipped and resolved by the later pass
+        """
+        self._interpolation = self._extended_interpolation
+
+        # one raw scan decides whether interpolation is needed at all; configurations without
+        # a single ${...} placeholder take their values as-is, skipping the regex machinery
+        raw_items = {section: self.items(section=section, raw=True) for section in self.sections()}
+        needs_interpolation = any(value is not None and '${' in value
+                                  for _items in raw_items.values()
+                                  for _option, value in _items)
+
+        resolved = dict()
+        if not needs_interpolation:
+            for section, _items in raw_items.items():
+                for option, value in _items:
+                    resolved[(section, option)] = value
+        else:
+            for section in raw_items:
+                try:
+                    for option, value in self.items(section=section):
+                        resolved[(section, option)] = value
+                except InterpolationError:
+                    # the section references options from a file which is not read yet
+                    continue
+        self._resolved = resolved
+        # with every resolvable option cached, late get() calls can skip the ${...} regex machinery
+        self._interpolation = Interpolation()
+
+    _UNSET = object()
+
+    def _value(self, section: str, option: str, fallback=_UNSET):
+        """
+        Returns the pre-resolved value of given option, falling back to a regular ConfigParser
+        lookup for options which were not resolvable at _resolve_all time
+        """
+        try:
+            return self._resolved[(section, option)]
+        except KeyError:
+            if fallback is Config._UNSET:
+                return self.get(section=section, option=option)
+            return self.get(section=section, option=option, fallback=fallback)
+
+    # subclasses override with their list of (section, option) pairs
+    REQUIRED_OPTIONS = []
 
-    def _verfy_config(self, required_options: list):
+    def _verfy_config(self, required_options: list = None):
         """
-        Checks if all required configuration is in place
+        Checks if all required configuration is in place; defaults to the class-level
+        REQUIRED_OPTIONS so each configuration is validated exactly once
         """
+        if required_options is None:
+            required_options = self.REQUIRED_OPTIONS
         violations = list()
         for ropt in required_options:
             val = self.get(section=ropt[0], option=ropt[1])
@@ -183,40 +408,48 @@ class Config(InstallationComponent, ConfigParser):
             self.raise_exception(f'The configuration misses the following required options: {str(violations)}')
 
     def get_service_full_name(self):
-        return self.get(section=self.SECTION_SERVICE, option=self.OPTION_NAME)
+        return self._value(section=self.SECTION_SERVICE, option=self.OPTION_NAME)
 
     def get_service_short_name(self):
-        return self.get(section=self.SECTION_GENERAL, option=self.OPTION_SHORT_NAME)
+        return self._value(section=self.SECTION_GENERAL, option=self.OPTION_SHORT_NAME)
 
     def get_service_description(self):
-        return self.get(section=self.SECTION_SERVICE, option=self.OPTION_DESCRIPTION, fallback='BHS Service')
+        return self._value(section=self.SECTION_SERVICE, option=self.OPTION_DESCRIPTION, fallback='BHS Service')
 
     def get_path_venv(self):
-        return self.get(section=self.SECTION_PATH, option=self.OPTION_VENV)
+        return self._value(section=self.SECTION_PATH, option=self.OPTION_VENV)
 
     def get_path_base_dir(self):
-        return self.get(section=self.SECTION_PATH, option=self.OPTION_BASE_DIR)
+        return self._value(section=self.SECTION_PATH, option=self.OPTION_BASE_DIR)
 
     def get_main_module(self) -> str:
-        return self.get(section=self.SECTION_MODULES, option=self.OPTION_MAIN_MODULE)
+        return self._value(section=self.SECTION_MODULES, option=self.OPTION_MAIN_MODULE)
 
     def get_modules_lookup_paths(self) -> list:
-        _paths = list()
-        if self.has_option(section=self.SECTION_PATH, option=self.OPTION_LOOKUP_PATH):
-            split = self.get(section=self.SECTION_PATH, option=self.OPTION_LOOKUP_PATH).split(",")
-            for el in split:
-                _paths.append(el.strip())
-        else:
-            _paths.append("../")
-        return _paths
+        if self._modules_lookup_paths is None:
+            if self.has_option(section=self.SECTION_PATH, option=self.OPTION_LOOKUP_PATH):
+                self._modules_lookup_paths = \
+                    [el.strip()
+                     for el in self.get(section=self.SECTION_PATH, option=self.OPTION_LOOKUP_PATH).split(",")
+                     if el.strip()]
+            else:
+                self._modules_lookup_paths = ["../"]
+        return self._modules_lookup_paths
 
     def get_path_service_log(self) -> str:
         # keep the value in self.SECTION_PATH / self.OPTION_SERVICE_LOG
         if self.has_option(self.SECTION_PATH, self.OPTION_SERVICE_LOG):
             return self.get(self.SECTION_PATH, self.OPTION_SERVICE_LOG)
 
-        parser = ConfigParser()
-        parser.read(self.get_path_origin_service_ini())
+        origin_ini = self.get_path_origin_service_ini()
+        # keyed by (path, mtime) so a file modified between calls is not served stale
+        _stat = _probe(origin_ini)
+        _cache_key = (origin_ini, _stat.st_mtime_ns if _stat is not None else None)
+        parser = Config._origin_ini_cache.get(_cache_key)
+        if parser is None:
+            # the origin ini is plain key=value, so the lightweight regex reader suffices
+            parser = FastIni(origin_ini)
+            Config._origin_ini_cache[_cache_key] = parser
 
         log_dir = '/var/log/bhs'
         if parser.has_option('LOG', 'logfile'):
@@ -227,89 +460,310 @@ class Config(InstallationComponent, ConfigParser):
         return log_dir
 
     def get_path_service_ini(self) -> str:
-        return self.get(self.SECTION_PATH, self.OPTION_SERVICE_INI)
+        return self._value(self.SECTION_PATH, self.OPTION_SERVICE_INI)
 
     def get_path_origin_service_ini(self) -> str:
-        return os.path.join('./config', self.get_service_short_name() + '.ini')
+        if self._path_origin_service_ini is None:
+            self._path_origin_service_ini = os.path.join('./config', self.get_service_short_name() + '.ini')
+        return self._path_origin_service_ini
 
     def get_path_service_env_ini(self) -> str:
-        return os.path.join(self.get_path_service_ini(), 'env.ini')
+        if self._path_service_env_ini is None:
+            self._path_service_env_ini = os.path.join(self.get_path_service_ini(), 'env.ini')
+        return self._path_service_env_ini
 
     def get_path_systemd(self) -> str:
-        return os.path.join('/etc/systemd/system', self.get_service_full_name()+'.service')
+        if self._path_systemd is None:
+            self._path_systemd = os.path.join('/etc/systemd/system', self.get_service_full_name()+'.service')
+        return self._path_systemd
 
     def get_database_db(self, test_mode: bool) -> str:
-        return self.get(self.SECTION_DATABASE, self.OPTION_DB_TEST, fallback='bhs_test') \
-            if test_mode else self.get(self.SECTION_DATABASE, self.OPTION_DB, fallback='bhs')
+        return self._value(self.SECTION_DATABASE, self.OPTION_DB_TEST, fallback='bhs_test') \
+            if test_mode else self._value(self.SECTION_DATABASE, self.OPTION_DB, fallback='bhs')
 
     def get_database_host(self) -> str:
-        return self.get(self.SECTION_DATABASE, self.OPTION_HOST)
+        return self._value(self.SECTION_DATABASE, self.OPTION_HOST)
 
     def get_database_credentials(self) -> tuple:
-        sect = self.get_service_short_name().upper()
-        return self.get(sect, self.OPTION_USER), self.get(sect, self.OPTION_PASSWORD)
+        if self._database_credentials is None:
+            sect = self.get_service_short_name().upper()
+            self._database_credentials = self._value(sect, self.OPTION_USER), self._value(sect, self.OPTION_PASSWORD)
+        return self._database_credentials
 
     def get_other_credentials(self) -> dict:
         sect = self.get_service_short_name().upper()
-        _add_options = {}
-        _all_options = self.options(section=sect)
-        for _option in _all_options:
-            if _option != self.OPTION_USER and _option != self.OPTION_PASSWORD:
-                _add_options[_option] = self.get(sect, _option)
+        _add_options = {_option: self._value(sect, _option)
+                        for _option in self.options(section=sect)
+                        if _option != self.OPTION_USER and _option != self.OPTION_PASSWORD}
 
-        if len(_add_options) > 0:
-            _add_options = {sect: _add_options}
+        return {sect: _add_options} if _add_options else {}
 
-        return _add_options
+
+class WsgiServiceConfig(Config):
+    """
+    Base configuration of the services hosted on mod-wsgi (REST service, web application),
+    holding the options and accessors both installers share
+    """
+
+    OPTION_WSGI = "wsgi"
+
+    # options of the MODULES section that are not plain modules; frozenset gives O(1) membership
+    EXCLUDED_MODULE_OPTIONS = frozenset((Config.OPTION_MAIN_MODULE, OPTION_WSGI))
+
+    REQUIRED_OPTIONS = [(Config.SECTION_PATH, Config.OPTION_VENV)]
+
+    def __init__(self, config_file):
+        Config.__init__(self, config_file)
+        self._verfy_config()
+        self._mod_wsgi_location = os.path.join(self.get_path_venv(), 'bin')
+        # the MODULES section is consulted by several getters; materialize it once
+        # from the already-resolved values
+        self._modules_section = {option: value
+                                 for (section, option), value in self._resolved.items()
+                                 if section == self.SECTION_MODULES}
+
+    def get_path_mod_wsgi_express_location(self) -> str:
+        return self._mod_wsgi_location
+
+    def get_external_modules(self) -> list:
+        return list(self.options(section=self.SECTION_EXTERNAL_MODULES)) \
+            if self.has_section(section=self.SECTION_EXTERNAL_MODULES) else list()
+
+    def get_modules(self) -> list:
+        return [_module for _module in self._modules_section
+                if _module not in self.EXCLUDED_MODULE_OPTIONS]
+
+    def get_main_module(self) -> str:
+        return self._modules_section.get(self.OPTION_MAIN_MODULE)
+
+    def get_wsgi_file(self) -> str:
+        return self._modules_section.get(self.OPTION_WSGI)
 
 
 class SubprocessAction(InstallationComponent):
 
+    # sudo credentials are pre-warmed once per installer run (sudo -v), all subsequent
+    # invocations run non-interactive (sudo -n) and skip the PAM round-trip
+    _sudo_primed = False
+    _sudo_prime_lock = threading.Lock()
+
     def __init__(self):
         InstallationComponent.__init__(self)
         self.error = None
+        self._error_lock = threading.Lock()
+        # the documented usage is sudo ./inserv.py; when already privileged there is no need
+        # to fork sudo+cp for simple file operations
+        self._am_root = hasattr(os, 'geteuid') and os.geteuid() == 0
 
     def _component_name(self):
         return 'COMMAND'
 
-    def execute(self, command: list, must_succeed: bool = False):
+    def _prepare_command(self, command: list) -> list:
+        """
+        Prepares a command for execution: for sudo invocations of a non-privileged installer the
+        credentials are primed once upfront, then the cached ticket is reused non-interactively
+        """
+        if self._am_root or not command or command[0] != 'sudo':
+            if command and not os.path.isabs(command[0]):
+                return [_resolve_executable(command[0])] + command[1:]
+            return command
+
+        if not SubprocessAction._sudo_primed:
+            with SubprocessAction._sudo_prime_lock:
+                if not SubprocessAction._sudo_primed:
+                    try:
+                        subprocess.run([_resolve_executable('sudo'), '-v'])
+                    except OSError:
+                        pass  # no sudo available; the actual command will report the real problem
+                    SubprocessAction._sudo_primed = True
 
-        exec_res = subprocess.run(command, capture_output=True)
+        return [_resolve_executable('sudo'), '-n'] + command[1:]
+
+    def execute(self, command: list, must_succeed: bool = False, capture: bool = True):
+
+        command = self._prepare_command(command)
+
+        if capture:
+            exec_res = subprocess.run(command, capture_output=True)
+        else:
+            # callers not interested in the output (mkdir, chmod, rm, ...) skip the stdout pipe;
+            # stderr is still collected for the failure report
+            exec_res = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
 
         if exec_res and exec_res.returncode == 0:
-            # success, catch output
-            self.log().debug(f'Executing {str(command)} SUCCEEDED. '
-                             f'Stdout: <{exec_res.stdout.decode("utf-8").rstrip()}>')
+            # success; do not pay for decoding the output unless debug logging is actually on
+            if self.log().isEnabledFor(logging.DEBUG):
+                self.log().debug(f'Executing {str(command)} SUCCEEDED. '
+                                 f'Stdout: <{exec_res.stdout.decode("utf-8").rstrip() if exec_res.stdout else ""}>')
         else:
-            self.error = f'Executing {str(command)} FAILED.\n' \
-                         f'Return code: {exec_res.returncode if exec_res else "N/A"};\n' \
-                         f'Stdout: <{exec_res.stdout.decode("utf-8").rstrip() if exec_res and exec_res.stdout else "N/A"}>;\n' \
-                         f'Stderr: <{exec_res.stderr.decode("utf-8").rstrip() if exec_res and exec_res.stderr else "N/A"}>'
+            error = f'Executing {str(command)} FAILED.\n' \
+                    f'Return code: {exec_res.returncode if exec_res else "N/A"};\n' \
+                    f'Stdout: <{exec_res.stdout.decode("utf-8").rstrip() if exec_res and exec_res.stdout else "N/A"}>;\n' \
+                    f'Stderr: <{exec_res.stderr.decode("utf-8").rstrip() if exec_res and exec_res.stderr else "N/A"}>'
+
+            # the action may execute commands from multiple threads, keep the last error consistent
+            with self._error_lock:
+                self.error = error
 
             if must_succeed:
-                self.raise_exception(self.error)
+                self.raise_exception(error)
             else:
-                self.log().warning(self.error)
+                self.log().warning(error)
+
+    def execute_background(self, command: list) -> subprocess.Popen:
+        """
+        Spawns the given command without waiting for it, so independent install steps can run
+        while it proceeds; completion is collected with wait_for. Stdout is discarded, stderr is
+        piped for the eventual failure report. Sudo handling matches execute
+        :param command: the command to spawn, in the same form as accepted by execute
+        :return: the started process handle
+        """
+        command = self._prepare_command(command)
+        self.log().debug(f'Started in background: {str(command)}')
+        return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def wait_for(self, process: subprocess.Popen, must_succeed: bool = False):
+        """
+        Waits for a process started with execute_background, applying the usual error handling
+        :param process: the handle returned by execute_background
+        :param must_succeed: if True, a non-zero exit raises InstallationException
+        """
+        _stdout, _stderr = process.communicate()
+        if process.returncode == 0:
+            self.log().debug(f'Background execution of {str(process.args)} SUCCEEDED')
+        else:
+            error = f'Executing {str(process.args)} FAILED.\n' \
+                    f'Return code: {process.returncode};\n' \
+                    f'Stderr: <{_stderr.decode("utf-8").rstrip() if _stderr else "N/A"}>'
+
+            with self._error_lock:
+                self.error = error
+
+            if must_succeed:
+                self.raise_exception(error)
+            else:
+                self.log().warning(error)
+
+    def execute_shell(self, script: str, must_succeed: bool = False, capture: bool = True):
+        """
+        Executes the given shell script under a single sudo invocation.
+        Lets the shell sequence related commands locally instead of paying fork+exec+sudo per command
+        :param script: the shell script to run; the caller is responsible for quoting (see shlex.quote)
+        :param must_succeed: if True, failure raises InstallationException
+        :param capture: if False, stdout of the script is discarded (stderr is still collected)
+        """
+        self.execute(command=['sudo', 'sh', '-c', script], must_succeed=must_succeed, capture=capture)
+
+    def execute_batch(self, commands: list, must_succeed: bool = False, capture: bool = True):
+        """
+        Executes the provided commands as a single sudo invocation by joining them with &&
+        This way the cost of forking sudo (and authenticating) is paid once instead of once per command
+        :param commands: list of commands, each being a list of arguments (without leading sudo)
+        :param must_succeed: if True, failure of any of the chained commands raises InstallationException
+        :param capture: if False, stdout of the commands is discarded (stderr is still collected)
+        """
+        self.execute_shell(' && '.join(shlex.join(command) for command in commands),
+                           must_succeed=must_succeed, capture=capture)
+
+    def copy(self, src: str, dst: str, update_only: bool = False):
+        """
+        Copies a single file to the destination, creating the target directory if needed.
+        When the installer already runs as root the copy is executed in-process (no subprocess fork),
+        otherwise it falls back to a single sudo shell invocation
+        :param src: path of the file to be copied
+        :param dst: target path of the copy
+        :param update_only: mirrors cp -u: skips the copy if the destination is not older than the source
+        """
+        if update_only:
+            # two stats decide the skip up front, so on re-installs neither the in-process copy
+            # nor the sudo subprocess is paid for files that are already in place
+            src_stat = _probe(src)
+            dst_stat = _probe(dst)
+            if src_stat is not None and dst_stat is not None \
+                    and dst_stat.st_size == src_stat.st_size \
+                    and dst_stat.st_mtime >= src_stat.st_mtime:
+                self.log().debug(f'Copy of {src} skipped, {dst} is up to date')
+                return
+
+        if self._am_root:
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copy2(src, dst)
+            self.log().debug(f'{src} copied to {dst}')
+        else:
+            cp_command = ['cp', '-u', '-r', src, dst] if update_only else ['cp', '-r', src, dst]
+            self.execute_batch([['mkdir', '-p', os.path.dirname(dst)], cp_command],
+                               must_succeed=True, capture=False)
+
+    def make_public_dir(self, path: str):
+        """
+        Creates the directory (parents included) and opens its access rights to all users.
+        When the installer already runs as root this is two direct syscalls; otherwise the
+        mkdir and chmod are chained under a single sudo shell
+        :param path: the directory to create
+        """
+        if self._am_root:
+            os.makedirs(path, exist_ok=True)
+            # ugo+rw while preserving the execute/search bits
+            os.chmod(path, os.stat(path).st_mode | 0o666)
+        else:
+            self.execute_batch(commands=[['mkdir', '-p', path], ['chmod', 'ugo+rw', path]],
+                               must_succeed=True, capture=False)
+
+    def remove_tree(self, path: str):
+        """
+        Removes the given directory with all its content.
+        When the installer already runs as root this is done in-process with shutil.rmtree,
+        otherwise by the usual sudo rm subprocess; in both variants failures are logged, not raised
+        :param path: the directory to remove
+        """
+        if self._am_root:
+            shutil.rmtree(path, ignore_errors=True)
+            self.log().debug(f'The directory {path} removed (in-process)')
+        else:
+            self.execute(command=['sudo', 'rm', '-rd', path], must_succeed=False, capture=False)
 
 
 class ServiceControl(SubprocessAction):
 
-    def __init__(self, service_name: str):
+    def __init__(self, service_name: str, unit_path: str = None):
         SubprocessAction.__init__(self)
         self.service_name = service_name
+        self.unit_path = unit_path
 
     def _component_name(self):
         return 'SYSTEMCTL'
 
+    def is_installed(self) -> bool:
+        """
+        Tells whether the unit file of the service exists, so stop/disable round trips can be
+        skipped on a fresh installation. Without a known unit path the service is assumed installed
+        """
+        if self.unit_path is None:
+            return True
+        return _probe(self.unit_path) is not None
+
     def stop(self):
         self.execute(command=['sudo', 'systemctl', 'stop', self.service_name], must_succeed=False)
 
     def disable(self):
         self.execute(command=['sudo', 'systemctl', 'disable', self.service_name], must_succeed=False)
 
+    def stop_and_disable(self):
+        # 'disable --now' stops and disables within a single systemd transaction,
+        # saving a subprocess spawn and a DBus round trip
+        self.execute(command=['sudo', 'systemctl', 'disable', '--now', self.service_name],
+                     must_succeed=False)
+
     def install(self):
-        self.execute(command=['sudo', 'systemctl', 'daemon-reload'], must_succeed=True)
-        self.execute(command=['sudo', 'systemctl', 'enable', self.service_name+".service"], must_succeed=True)
+        self.execute_batch(commands=[['systemctl', 'daemon-reload'],
+                                     ['systemctl', 'enable', self.service_name+".service"]],
+                           must_succeed=True)
+
+    def install_and_start(self):
+        self.execute_batch(commands=[['systemctl', 'daemon-reload'],
+                                     ['systemctl', 'enable', self.service_name+".service"],
+                                     ['systemctl', 'start', self.service_name]],
+                           must_succeed=True)
 
     def start(self):
         self.execute(command=['sudo', 'systemctl', 'start', self.service_name], must_succeed=True)
@@ -317,49 +771,149 @@ class ServiceControl(SubprocessAction):
 
 class VenvManager(SubprocessAction):
 
+    # written into the venv once it is fully set up, so later installs can skip the bootstrap
+    PROVISIONED_MARKER = '.provisioned'
+
     def __init__(self, venv_path: str):
         SubprocessAction.__init__(self)
         self._path = venv_path
+        # the interpreter path is a pure function of the venv path; joined once here
+        self._python = os.path.join(venv_path, 'bin', 'python')
+        self._marker_path = os.path.join(venv_path, self.PROVISIONED_MARKER)
+        self._site_packages = None
 
     def _component_name(self):
         return 'VENV'
 
-    def create(self):
+    def is_provisioned(self) -> bool:
+        """
+        Tells whether the venv was fully set up by a previous install, as recorded by
+        mark_provisioned; the --clear bootstrap and the pip resolution can then be skipped
+        """
+        return _probe(self._marker_path) is not None
+
+    def mark_provisioned(self):
+        """
+        Drops the marker file into the venv; to be called once the venv is created
+        and all external modules are installed
+        """
+        if self._am_root:
+            open(self._marker_path, 'w').close()
+        else:
+            self.execute(command=['sudo', 'touch', self._marker_path], must_succeed=False, capture=False)
+
+    def create(self) -> bool:
+        """
+        Creates the virtual environment, unless the provisioned-marker of a previous
+        install is present
+        :return: True if the venv was (re)created and needs its modules installed
+        """
+        if self.is_provisioned():
+            self.log().debug(f'The virtual environment {self._path} is already provisioned, creation skipped')
+            return False
+
         self.execute(command=['sudo', 'python3', '-m', 'venv', '--clear', self._path], must_succeed=True)
+        self._site_packages = None
+        return True
 
     def remove(self):
-        self.execute(command=['sudo', 'rm', '-rd', self._path], must_succeed=False)
+        self.remove_tree(self._path)
 
     def install_module(self, _module: str):
         self.execute(command=['sudo', os.path.join(self._path, 'bin', 'pip3'), 'install', _module.replace(' ', '==')],
                      must_succeed=True)
 
+    def install_modules(self, modules: list):
+        """
+        Installs all given external modules with a single pip invocation.
+        pip re-imports itself and resolves dependencies once instead of once per module
+        :param modules: the module names, optionally with space-separated version (as in the config)
+        """
+        if not modules:
+            return
+        self.execute(command=['sudo', os.path.join(self._path, 'bin', 'pip3'), 'install']
+                             + [_module.replace(' ', '==') for _module in modules],
+                     must_succeed=True)
+
     def get_python(self):
-        return os.path.join(self._path, 'bin', 'python')
+        return self._python
+
+    def get_path(self):
+        return self._path
+
+    def get_site_packages(self) -> str:
+        """
+        Returns the site-packages directory of the virtual environment.
+        Instead of hardcoding the python version, the path is asked of the venv's own interpreter
+        once and cached; if the interpreter is not available (yet), a lookup of
+        lib/python3.*/site-packages is attempted before falling back to the historical default
+        """
+        if self._site_packages:
+            return self._site_packages
+
+        try:
+            probe = subprocess.run(
+                [self.get_python(), '-c', "import sysconfig; print(sysconfig.get_paths()['purelib'])"],
+                capture_output=True)
+            if probe.returncode == 0:
+                self._site_packages = probe.stdout.decode('utf-8').strip()
+        except OSError:
+            pass
+
+        if not self._site_packages:
+            located = glob.glob(os.path.join(self._path, 'lib', 'python3.*', 'site-packages'))
+            self._site_packages = located[0] if located \
+                else os.path.join(self._path, 'lib', 'python3.7', 'site-packages')
+
+        return self._site_packages
 
 
 class LocalModuleManager(SubprocessAction):
 
-    def __init__(self, lookup_paths: list, venv_path: str):
+    def __init__(self, lookup_paths: list, venv_mngr: VenvManager):
         SubprocessAction.__init__(self)
         self._lookup_paths = lookup_paths
-        self.modules_target_path = os.path.join(venv_path, 'lib', 'python3.7', 'site-packages')
-        self._venv_path = venv_path
+        self._dir_index = dict()
+        self._venv = venv_mngr
+        self._venv_path = venv_mngr.get_path()
         self.base_dir = os.path.dirname(self._venv_path)
         self.main_module_target_path = None  # will be intialized during installation
 
+    @property
+    def modules_target_path(self):
+        # resolved lazily - the venv interpreter may not exist before VenvManager.create is executed
+        return self._venv.get_site_packages()
+
     def _component_name(self):
         return 'MODULE'
 
     def _module_file(self, _module: str):
-        return _module if _module.endswith('.py') or _module.endswith('.wsgi') else _module + '.py'
+        return _module if _module.endswith(('.py', '.wsgi')) else _module + '.py'
+
+    def _dir_entries(self, dir_path: str) -> set:
+        """
+        Returns the (cached) set of regular-file names within given directory.
+        One os.scandir replaces a pair of stat calls per (lookup-path, module) combination -
+        DirEntry.is_file resolves from the directory record without an extra syscall;
+        a non-existing directory is represented by an empty set
+        """
+        entries = self._dir_index.get(dir_path)
+        if entries is None:
+            try:
+                with os.scandir(dir_path) as scan:
+                    entries = {entry.name for entry in scan if entry.is_file()}
+            except (FileNotFoundError, NotADirectoryError):
+                entries = set()
+            self._dir_index[dir_path] = entries
+        return entries
 
     def _find_module(self, _module, is_regular_file=False):
         module_path = list()
         module_file = self._module_file(_module) if not is_regular_file else _module
         for path in self._lookup_paths:
             p = os.path.join(path, module_file)
-            if os.path.exists(p) and os.path.isfile(p):
+            directory, file_name = os.path.split(p)
+            if file_name in self._dir_entries(directory):
                 module_path.append(p)
 
         if len(module_path) > 1:
@@ -377,8 +931,38 @@ class LocalModuleManager(SubprocessAction):
 
         # copy the located .py file to target directory
         target_path = os.path.join(self.modules_target_path, self._module_file(_module=_module))
-        self.execute(['sudo', 'mkdir', '-p', os.path.dirname(target_path)], must_succeed=True)
-        self.execute(['sudo', 'cp', '-u', '-r', module_path, target_path], must_succeed=True)
+        self.copy(module_path, target_path, update_only=True)
+
+    def install_modules(self, modules: list):
+        """
+        Installs all given modules at once.
+        All target directories are created with a single mkdir -p call, then the copies are batched
+        per target directory (one cp invocation each) and executed in parallel - instead of paying
+        the subprocess-spawn cost twice per module
+        :param modules: the names of the modules to be installed, as listed in the configuration
+        """
+        if not modules:
+            return
+
+        sources_per_target_dir = dict()
+        for _module in modules:
+            module_path = self._find_module(_module=_module)
+            target_path = os.path.join(self.modules_target_path, self._module_file(_module=_module))
+            sources_per_target_dir.setdefault(os.path.dirname(target_path), list()).append(module_path)
+
+        if self._am_root:
+            # already privileged: plain in-process copies, no subprocesses at all
+            for target_dir, sources in sources_per_target_dir.items():
+                for source in sources:
+                    self.copy(source, os.path.join(target_dir, os.path.basename(source)), update_only=True)
+            return
+
+        self.execute(['sudo', 'mkdir', '-p'] + sorted(sources_per_target_dir), must_succeed=True, capture=False)
+
+        with ThreadPoolExecutor(max_workers=min(8, len(sources_per_target_dir))) as executor:
+            list(executor.map(
+                lambda entry: self.execute(['sudo', 'cp', '-u', '-r'] + entry[1] + [entry[0]], must_succeed=True),
+                sources_per_target_dir.items()))
 
     def install_main_module(self, _main_module: str) -> str:
         main_module_file = self._find_module(_main_module)
@@ -387,17 +971,21 @@ class LocalModuleManager(SubprocessAction):
         self.main_module_target_path = os.path.join(self.base_dir,
                                                     os.path.basename(self._module_file(_module=_main_module)))
 
-        with open(main_module_file, 'r') as _origin, open(self.main_module_target_path, 'w', encoding='utf-8') as _target:
-            shebang = _origin.readline()
-            if not shebang.startswith('#!'):
-                self.raise_exception(f'First code line in main module {_main_module} does not seem to contain shebang')
+        # rewrite the shebang with a single read and a single write instead of line-by-line iteration
+        with open(main_module_file, 'rb') as _origin:
+            content = _origin.read()
+
+        if not content.startswith(b'#!'):
+            self.raise_exception(f'First code line in main module {_main_module} does not seem to contain shebang')
+
+        shebang = b'#!' + os.path.join(self._venv_path, 'bin', 'python3').encode('utf-8') + b'\n'
+        first_line_end = content.find(b'\n') + 1
 
-            shebang = '#!'+os.path.join(self._venv_path, 'bin', 'python3')+'\n'
-            _target.write(shebang)
-            _target.writelines(_origin.readlines())
+        with open(self.main_module_target_path, 'wb') as _target:
+            _target.write(shebang + content[first_line_end if first_line_end > 0 else len(content):])
 
         # ensure it is executable!
-        self.execute(['chmod', '-v', 'u+x', self.main_module_target_path])
+        self.execute(['chmod', 'u+x', self.main_module_target_path], capture=False)
 
         return self.main_module_target_path
 
@@ -406,48 +994,54 @@ class LocalModuleManager(SubprocessAction):
 
         target_path = os.path.join(self.base_dir, _module_file)
 
-        self.execute(['sudo', 'mkdir', '-p', os.path.dirname(target_path)], must_succeed=True)
-        self.execute(['sudo', 'cp', '-u', '-r', file_path, target_path], must_succeed=True)
+        self.copy(file_path, target_path, update_only=True)
 
         return target_path
 
     def remove_all(self):
-        self.execute(command=['sudo', 'rm', '-rd', self.base_dir], must_succeed=False)
+        self.remove_tree(self.base_dir)
 
 
-class SystemdServiceCreator(SubprocessAction, ConfigParser):
-    SECTION_UNIT = 'Unit'
-    SECTION_SERVICE = 'Service'
+class SystemdServiceCreator(SubprocessAction):
+    """
+    Creates the systemd unit file from a template with ${description}, ${exec_start}
+    and ${working_directory} placeholders.
+    The template is plain text substituted in a single pass - no need to drag the whole
+    ConfigParser parse/serialize machinery through a ~20-line unit file
+    """
 
-    OPTION_DESCRIPTION = 'Description'
-    OPTION_EXEC_START = 'ExecStart'
-    OPTION_WORKING_DIRECTORY = 'WorkingDirectory'
+    DEFAULT_DESCRIPTION = 'BHS Service'
 
     def __init__(self, template_file: str,  target_file: str):
-        InstallationComponent.__init__(self)
-        ConfigParser.__init__(self)
-        self.optionxform = str  # preserves case-sensitivity of options
+        SubprocessAction.__init__(self)
         self.target_file = target_file
-        self.read(template_file)
+        self.template_file = template_file
+        try:
+            with open(template_file, 'r', encoding='utf-8') as _template:
+                self._template = string.Template(_template.read())
+        except FileNotFoundError:
+            # tolerated at construction time (mirrors ConfigParser.read); create() will complain
+            self._template = None
 
     def _component_name(self):
         return 'SYSTEMD-INI'
 
     def create(self, exec_start: str, working_directory: str, service_descripton: str = None) -> str:
-        if service_descripton:
-            self.set(self.SECTION_UNIT, self.OPTION_DESCRIPTION, service_descripton)
-        if exec_start:
-            self.set(self.SECTION_SERVICE, self.OPTION_EXEC_START, exec_start)
-        if working_directory:
-            self.set(self.SECTION_SERVICE, self.OPTION_WORKING_DIRECTORY, working_directory)
+        if self._template is None:
+            self.raise_exception(f'The template file {self.template_file} does not exist')
+
+        content = self._template.safe_substitute(
+            description=service_descripton if service_descripton else self.DEFAULT_DESCRIPTION,
+            exec_start=exec_start if exec_start else '',
+            working_directory=working_directory if working_directory else '')
 
         with open(self.target_file, 'w', encoding='utf-8') as _w_file:
-            self.write(_w_file, space_around_delimiters=False)
+            _w_file.write(content)
 
         return self.target_file
 
     def remove(self):
-        self.execute(command=['sudo', 'rm', '-fv', self.target_file], must_succeed=False)
+        self.execute(command=['sudo', 'rm', '-f', self.target_file], must_succeed=False, capture=False)
 
 
 class EnvIniCreator(InstallationComponent, ConfigParser):
@@ -495,17 +1089,12 @@ class IniManager(SubprocessAction):
         return 'SERVICE-INI'
 
     def copy_ini(self):
-        # ensure the target dir exists
-        self.execute(['sudo', 'mkdir', '-p', self.ini_base_dir], must_succeed=True)
-        self.log().debug(f'Ensured that service config (ini) basedir {self.ini_base_dir} exists')
-
-        # copy the file
-        self.execute(['sudo', 'cp', '-r', self.ini_origin_file_path, self.ini_target_file_path],
-                     must_succeed=True)
+        # ensure the target dir exists and copy the file
+        self.copy(self.ini_origin_file_path, self.ini_target_file_path)
         self.log().debug(f'Service config file {self.ini_origin_file_path} is copied to {self.ini_target_file_path}')
 
     def remove(self):
-        self.execute(command=['sudo', 'rm', '-rd', self.ini_base_dir], must_succeed=False)
+        self.remove_tree(self.ini_base_dir)
 
 
 class ApacheModWsgiExpressServiceCreator(InstallationComponent):
@@ -4,55 +4,27 @@
 
 from _inscommon import *
 
-import sys
-from datetime import datetime
 
-
-class RestServiceConfig(Config):
+class RestServiceConfig(WsgiServiceConfig):
 
     SECTION_REST = 'REST'
 
-    OPTION_WSGI = "wsgi"
     OPTION_PORT = 'port'
 
-    REQUIRED_OPTIONS = [(Config.SECTION_PATH, Config.OPTION_VENV)]
+    SERVICE_FULL_NAME = 'BHS-Info-REST'
+    SERVICE_DESCRIPTION = 'BHS REST Information Service'
 
-    def __init__(self, config_file):
-        Config.__init__(self, config_file)
-        self._verfy_config(RestServiceConfig.REQUIRED_OPTIONS)
+    # the systemd unit path is a pure function of the (fixed) service name
+    PATH_SYSTEMD = os.path.join('/etc/systemd/system', SERVICE_FULL_NAME + '.service')
 
     def get_service_full_name(self) -> str:
-        return 'BHS-Info-REST'
+        return self.SERVICE_FULL_NAME
 
     def get_service_description(self):
-        return 'BHS REST Information Service'
-
-    def get_path_mod_wsgi_express_location(self) -> str:
-        return os.path.join(self.get_path_venv(), 'bin')
-
-    def get_external_modules(self) -> list:
-        _modules = list()
-
-        if self.has_section(section=self.SECTION_EXTERNAL_MODULES):
-            _modules.extend(self.options(section=self.SECTION_EXTERNAL_MODULES))
-
-        return _modules
-
-    def get_modules(self) -> list:
-        _modules = list()
-        if self.has_section(section=self.SECTION_MODULES):
-            internal = self.options(section=self.SECTION_MODULES)
-            for intern in internal:
-                if intern not in (self.OPTION_MAIN_MODULE, self.OPTION_WSGI):
-                    _modules.append(intern)
-
-        return _modules
-
-    def get_main_module(self) -> str:
-        return self.get(section=self.SECTION_MODULES, option=self.OPTION_MAIN_MODULE)
+        return self.SERVICE_DESCRIPTION
 
-    def get_wsgi_file(self) -> str:
-        return self.get(section=self.SECTION_MODULES, option=self.OPTION_WSGI)
+    def get_path_systemd(self) -> str:
+        return self.PATH_SYSTEMD
 
     def get_path_systemd_template(self) -> str:
         return './$template.mod-wsgi.service'
@@ -61,67 +33,59 @@ class RestServiceConfig(Config):
         return self.getint(section=self.SECTION_REST, option=self.OPTION_PORT)
 
 
-def init_logging() -> logging.Logger:
-    logging.basicConfig(
-        filename=os.path.join('x_log', f'{datetime.today().strftime("%Y%m%d%H%M%S")}_wsgi.log'),
-        level=logging.DEBUG,
-        format='%(asctime)s %(name)s %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    logger = logging.getLogger()
-    stream_hdlr = logging.StreamHandler(sys.stdout)
-    stream_hdlr.setLevel(logging.INFO)
-    stream_hdlr.setFormatter(logger.handlers[0].formatter)
-    logger.addHandler(stream_hdlr)
-    return logger
-
-
 if __name__ == '__main__':
     cmdline = CommandlineConfig()
-    log = init_logging()
+    log = init_logging('wsgi')
     # 'install/rest-info.config.ini'
     config = RestServiceConfig(config_file=cmdline.config_file)
-    service_ctrl = ServiceControl(service_name=config.get_service_full_name())
+    service_ctrl = ServiceControl(service_name=config.get_service_full_name(),
+                                  unit_path=config.get_path_systemd())
     venv_mngr = VenvManager(venv_path=config.get_path_venv())
     module_mngr = LocalModuleManager(lookup_paths=config.get_modules_lookup_paths(),
-                                     venv_path=config.get_path_venv())
+                                     venv_mngr=venv_mngr)
     systemd_creator = ApacheModWsgiExpressServiceCreator(template_file=config.get_path_systemd_template(),
                                                          target_file=config.get_path_systemd())
 
     ini_mngr = IniManager(target_dir=config.get_path_service_ini(),
                           ini_file=config.get_path_origin_service_ini())
-    envini_creator = EnvIniCreator(target_file=config.get_path_service_env_ini())
 
     if cmdline.install:
         # install mode
 
+        # needed by the install branch only; the uninstall path skips its construction
+        envini_creator = EnvIniCreator(target_file=config.get_path_service_env_ini())
+
         log.info(f'Installation initialized for service {config.get_service_full_name()}'
                  f'{" [minimal update only mode]" if cmdline.update_only else ""}')
 
-        service_ctrl.stop()
-        log.info(f'Service {config.get_service_full_name()} stopped')
+        # on a fresh box there is no unit to stop or disable; skip the systemctl round trips
+        service_installed = service_ctrl.is_installed()
 
-        if not cmdline.update_only:
-            service_ctrl.disable()
-            log.info(f'Service {config.get_service_full_name()} disabled')
+        if service_installed:
+            service_ctrl.stop()
+            log.info(f'Service {config.get_service_full_name()} stopped')
 
-            # create virtual environment
-            venv_mngr.create()
-            log.info(f'Virtual environment created @ {config.get_path_venv()}')
-
-            # installing external modules
-            externals = config.get_external_modules()
-            for external in externals:
-                venv_mngr.install_module(external)
-                log.info(f'Module {external} installed')
-            log.info(f'All external modules installed')
+        if not cmdline.update_only:
+            if service_installed:
+                service_ctrl.disable()
+                log.info(f'Service {config.get_service_full_name()} disabled')
+
+            # create virtual environment, unless a previous install fully provisioned it
+            if venv_mngr.create():
+                log.info(f'Virtual environment created @ {config.get_path_venv()}')
+
+                # installing external modules, all with a single pip call
+                externals = config.get_external_modules()
+                venv_mngr.install_modules(externals)
+                venv_mngr.mark_provisioned()
+                log.info(f'All external modules installed: {", ".join(externals)}')
+            else:
+                log.info(f'Virtual environment @ {config.get_path_venv()} already provisioned, creation skipped')
 
         # installing BHS modules
         modules = config.get_modules()
-        for module in modules:
-            module_mngr.install_module(module)
-            log.info(f'Module {module} installed')
-        log.info(f'All modules installed')
+        module_mngr.install_modules(modules)
+        log.info(f'All modules installed: {", ".join(modules)}')
 
         # main module of the service
         main_module = config.get_main_module()
@@ -148,22 +112,25 @@ if __name__ == '__main__':
                                                          wsgi_file_path=wsgi_file_path, port=config.get_port())
             log.info(f'Systemd configuration file created @ {systemd_config_path}')
 
-            service_ctrl.install()
-            log.info(f'Systemd instructed to enable new service')
+            if cmdline.start_immediately:
+                # fusing enable and start into one systemctl batch saves one sudo fork
+                service_ctrl.install_and_start()
+                log.info(f'Systemd instructed to enable and start new service')
+            else:
+                service_ctrl.install()
+                log.info(f'Systemd instructed to enable new service')
 
         if cmdline.start_immediately:
-            service_ctrl.start()
+            if cmdline.update_only:
+                service_ctrl.start()
             log.info(f'{config.get_service_full_name()} started')
 
     else:
         # uninstall
         log.info(f'Uninstall initialized for BHS REST service')
 
-        service_ctrl.stop()
-        log.info(f'Service {config.get_service_full_name()} stopped')
-
-        service_ctrl.disable()
-        log.info(f'Service {config.get_service_full_name()} disabled')
+        service_ctrl.stop_and_disable()
+        log.info(f'Service {config.get_service_full_name()} stopped and disabled')
 
         module_mngr.remove_all()
         log.info(f'The directory {module_mngr.base_dir} removed with all the content')
@@ -6,8 +6,7 @@ from _inscommon import *
 
 import sys
 import os.path
-import logging
-from datetime import datetime
+from types import MappingProxyType
 
 
 class ServiceConfig(Config):
@@ -24,105 +23,119 @@ class ServiceConfig(Config):
                 (Config.SECTION_MODULES, Config.OPTION_MAIN_MODULE),
                 (Config.SECTION_DATABASE, Config.OPTION_HOST)]
 
+    # parsed common.install.ini shared between instances and keyed by path and mtime,
+    # so batch installs driven from a single process tokenize the file only once
+    _common_cfg_cache = dict()
+
     def __init__(self, config_file):
         Config.__init__(self, config_file)
 
         config_dir = os.path.dirname(config_file)
         common_cfg = os.path.join(config_dir, ServiceConfig.COMMON_CFG_FILE)
 
-        if not os.path.exists(common_cfg):
+        try:
+            _cache_key = (common_cfg, os.stat(common_cfg).st_mtime_ns)
+            _common = ServiceConfig._common_cfg_cache.get(_cache_key)
+            if _common is None:
+                # slurped and fed to a throwaway parser, then snapshotted as plain dicts;
+                # subsequent instances merge the snapshot via read_dict without re-parsing
+                _parser = ConfigParser(allow_no_value=True, interpolation=None)
+                _parser.optionxform = str
+                with open(common_cfg, 'r') as _file:
+                    _parser.read_string(_file.read(), source=common_cfg)
+                # frozen on both levels: the snapshot is shared between instances,
+                # none of which may alter what the others read
+                _common = MappingProxyType(
+                    {_section: MappingProxyType(dict(_parser.items(section=_section, raw=True)))
+                     for _section in _parser.sections()})
+                ServiceConfig._common_cfg_cache[_cache_key] = _common
+            self.read_dict(_common, source=common_cfg)
+        except (FileNotFoundError, NotADirectoryError):
             self.raise_exception(
                 f'The file with common installation configuration: {common_cfg} '
                 f"does not exist")
 
-        self.read(common_cfg)
-        self._verfy_config(ServiceConfig.REQUIRED_OPTIONS)
-
-    def get_external_modules(self) -> list:
-        _all_modules = list()
-        if self.has_section(section=self.SECTION_COMMON_EXTERNAL_MODULES):
-            _all_modules = self.options(section=self.SECTION_COMMON_EXTERNAL_MODULES)
+        self._resolve_all()
+        self._verfy_config()
 
-        if self.has_section(section=self.SECTION_EXTERNAL_MODULES):
-            _all_modules.extend(self.options(section=self.SECTION_EXTERNAL_MODULES))
+        # lazy caches; the configuration is read-only once parsed
+        self._external_modules = None
+        self._modules = None
 
-        return _all_modules
+    def get_external_modules(self) -> list:
+        if self._external_modules is None:
+            _all_modules = list(self.options(section=self.SECTION_COMMON_EXTERNAL_MODULES)) \
+                if self.has_section(section=self.SECTION_COMMON_EXTERNAL_MODULES) else list()
+            if self.has_section(section=self.SECTION_EXTERNAL_MODULES):
+                _all_modules.extend(self.options(section=self.SECTION_EXTERNAL_MODULES))
+            self._external_modules = _all_modules
+        return self._external_modules
 
     def get_modules(self) -> list:
-        _modules = list()
-        if self.has_section(section=self.SECTION_COMMON_MODULES):
-            _modules = self.options(section=self.SECTION_COMMON_MODULES)
-
-        if self.has_section(section=self.SECTION_MODULES):
-            internal = self.options(section=self.SECTION_MODULES)
-            for intern in internal:
-                if intern != self.OPTION_MAIN_MODULE:
-                    _modules.append(intern)
-
-        return _modules
+        if self._modules is None:
+            _modules = list(self.options(section=self.SECTION_COMMON_MODULES)) \
+                if self.has_section(section=self.SECTION_COMMON_MODULES) else list()
+            if self.has_section(section=self.SECTION_MODULES):
+                _modules.extend(intern for intern in self.options(section=self.SECTION_MODULES)
+                                if intern != self.OPTION_MAIN_MODULE)
+            self._modules = _modules
+        return self._modules
 
     def get_path_systemd_template(self) -> str:
         return './$template.service'
 
 
-def init_logging(cmdline: CommandlineConfig) -> logging.Logger:
-    logging.basicConfig(
-        filename=os.path.join('./x_log',
-                           f'{datetime.today().strftime("%Y%m%d%H%M%S")}_{cmdline.install_config_file_name}.log'),
-        level=logging.DEBUG,
-        format='%(asctime)s %(name)s %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    logger = logging.getLogger()
-    stream_hdlr = logging.StreamHandler(sys.stdout)
-    stream_hdlr.setLevel(logging.INFO)
-    stream_hdlr.setFormatter(logger.handlers[0].formatter)
-    logger.addHandler(stream_hdlr)
-    return logger
-
-
 if __name__ == '__main__':
     try:
         cmdline = CommandlineConfig()
-        log = init_logging(cmdline)
+        log = init_logging(cmdline.install_config_file_name)
         config = ServiceConfig(config_file=cmdline.config_file)
-        service_ctrl = ServiceControl(service_name=config.get_service_full_name())
+        service_ctrl = ServiceControl(service_name=config.get_service_full_name(),
+                                      unit_path=config.get_path_systemd())
         venv_mngr = VenvManager(venv_path=config.get_path_venv())
         module_mngr = LocalModuleManager(lookup_paths=config.get_modules_lookup_paths(),
-                                         venv_path=config.get_path_venv())
+                                         venv_mngr=venv_mngr)
         systemd_creator = SystemdServiceCreator(template_file=config.get_path_systemd_template(),
                                                 target_file=config.get_path_systemd())
         ini_mngr = IniManager(target_dir=config.get_path_service_ini(),
                               ini_file=config.get_path_origin_service_ini())
-        envini_creator = EnvIniCreator(target_file=config.get_path_service_env_ini())
 
         if cmdline.install:
             # install
 
+            # needed by the install branch only; the uninstall path skips their construction
+            envini_creator = EnvIniCreator(target_file=config.get_path_service_env_ini())
+            subprocess_action = SubprocessAction()
+
             log.info(f'Installation initialized for service {config.get_service_full_name()}'
                      f'{" [minimal update only mode]" if cmdline.update_only else ""}')
 
-            service_ctrl.stop()
-            log.info(f'Service {config.get_service_full_name()} stopped')
+            # on a fresh box there is no unit to stop or disable; skip the systemctl round trips
+            service_installed = service_ctrl.is_installed()
+
+            if service_installed:
+                service_ctrl.stop()
+                log.info(f'Service {config.get_service_full_name()} stopped')
 
             if not cmdline.update_only:
-                service_ctrl.disable()
-                log.info(f'Service {config.get_service_full_name()} disabled')
+                if service_installed:
+                    service_ctrl.disable()
+                    log.info(f'Service {config.get_service_full_name()} disabled')
 
-                venv_mngr.create()
-                log.info(f'Virtual environment created @ {config.get_path_venv()}')
+                if venv_mngr.create():
+                    log.info(f'Virtual environment created @ {config.get_path_venv()}')
 
-                externals = config.get_external_modules()
-                for external in externals:
-                    venv_mngr.install_module(external)
-                    log.info(f'Module {external} installed')
-                log.info(f'All external modules installed')
+                    externals = config.get_external_modules()
+                    venv_mngr.install_modules(externals)
+                    venv_mngr.mark_provisioned()
+                    log.info(f'All external modules installed: {", ".join(externals)}')
+                else:
+                    log.info(f'Virtual environment @ {config.get_path_venv()} '
+                             f'already provisioned, creation skipped')
 
             modules = config.get_modules()
-            for module in modules:
-                module_mngr.install_module(module)
-                log.info(f'Module {module} installed')
-            log.info(f'All modules installed')
+            module_mngr.install_modules(modules)
+            log.info(f'All modules installed: {", ".join(modules)}')
 
             main_module = config.get_main_module()
             module_mngr.install_main_module(_main_module=main_module)
@@ -130,12 +143,9 @@ if __name__ == '__main__':
 
             if not cmdline.update_only:
                 service_log_dir = config.get_path_service_log()
-                if not os.path.exists(service_log_dir):
-                    SubprocessAction().execute(['mkdir', '-p', service_log_dir])
-                    log.info(f'Service log dir {service_log_dir} created')
-
-                SubprocessAction().execute(['chmod', 'ugo+rw', service_log_dir])
-                log.info(f'Access rights to service log dir {service_log_dir} amended')
+                # direct makedirs/chmod under root, one sudo shell otherwise
+                subprocess_action.make_public_dir(service_log_dir)
+                log.info(f'Service log dir {service_log_dir} created, access rights amended')
 
             ini_mngr.copy_ini()
             log.info(f'Service configuration file is copied to {ini_mngr.ini_target_file_path}')
@@ -153,13 +163,19 @@ if __name__ == '__main__':
                     working_directory=os.path.dirname(module_mngr.main_module_target_path))
                 log.info(f'Systemd configuration file created @ {systemd_config_path}')
 
-                service_ctrl.install()
-                log.info(f'Systemd instructed to enable new service')
+                if cmdline.start_immediately:
+                    # fusing enable and start into one systemctl batch saves one sudo fork
+                    service_ctrl.install_and_start()
+                    log.info(f'Systemd instructed to enable and start new service')
+                else:
+                    service_ctrl.install()
+                    log.info(f'Systemd instructed to enable new service')
 
             log.info(f'{config.get_service_full_name()} installed successfully')
 
             if cmdline.start_immediately:
-                service_ctrl.start()
+                if cmdline.update_only:
+                    service_ctrl.start()
                 log.info(f'{config.get_service_full_name()} started')
 
         else:
@@ -167,11 +183,8 @@ if __name__ == '__main__':
 
             log.info(f'De-installation initialized for service {config.get_service_full_name()}')
 
-            service_ctrl.stop()
-            log.info(f'Service {config.get_service_full_name()} stopped')
-
-            service_ctrl.disable()
-            log.info(f'Service {config.get_service_full_name()} disabled')
+            service_ctrl.stop_and_disable()
+            log.info(f'Service {config.get_service_full_name()} stopped and disabled')
 
             module_mngr.remove_all()
             log.info(f'The directory {module_mngr.base_dir} removed with all the content')
@@ -4,22 +4,23 @@
 
 from _inscommon import *
 
-import sys
-from datetime import datetime
+import hashlib
 
 
-class WebAppConfig(Config):
+class WebAppConfig(WsgiServiceConfig):
 
     SECTION_FILES = 'FILES'
 
     OPTION_DJANGO_MANAGER = 'django-manager'
-    OPTION_WSGI = "wsgi"
-
-    REQUIRED_OPTIONS = [(Config.SECTION_PATH, Config.OPTION_VENV)]
 
     def __init__(self, config_file):
-        Config.__init__(self, config_file)
-        self._verfy_config(WebAppConfig.REQUIRED_OPTIONS)
+        WsgiServiceConfig.__init__(self, config_file)
+
+        # lazy caches; the configuration is read-only once parsed
+        self._files = None
+        self._origin_django_manager = None
+        self._target_django_manager = None
+        self._target_dir_statics = None
 
     def get_service_full_name(self) -> str:
         return 'BHS-Info-WebApp'
@@ -27,78 +28,139 @@ class WebAppConfig(Config):
     def get_service_description(self):
         return 'BHS Web Application Information Service'
 
-    def get_path_mod_wsgi_express_location(self) -> str:
-        return os.path.join(self.get_path_venv(), 'bin')
-
-    def get_wsgi_file(self) -> str:
-        return self.get(section=self.SECTION_MODULES, option=self.OPTION_WSGI)
-
-    def get_external_modules(self) -> list:
-        _modules = list()
-
-        if self.has_section(section=self.SECTION_EXTERNAL_MODULES):
-            _modules.extend(self.options(section=self.SECTION_EXTERNAL_MODULES))
-
-        return _modules
-
-    def get_modules(self) -> list:
-        _modules = list()
-        if self.has_section(section=self.SECTION_MODULES):
-            internal = self.options(section=self.SECTION_MODULES)
-            for intern in internal:
-                if intern not in (self.OPTION_MAIN_MODULE, self.OPTION_WSGI):
-                    _modules.append(intern)
-
-        return _modules
-
     def get_files(self) -> list:
-        return self.options(section=self.SECTION_FILES)
+        if self._files is None:
+            # taken from the resolved snapshot, like the modules section of the parent class
+            self._files = [option for (section, option) in self._resolved
+                           if section == self.SECTION_FILES]
+        return self._files
 
     def get_path_systemd_template(self) -> str:
         return './$template.mod-wsgi.apachectl.service'
 
     def get_path_origin_django_manager(self) -> str:
+        if self._origin_django_manager is not None:
+            return self._origin_django_manager
+
+        # the resolved path is kept on the instance instead of being written back
+        # into the parser section, which would cost a set() plus another lookup
         if self.has_option(self.SECTION_PATH, self.OPTION_DJANGO_MANAGER):
-            return self.get(self.SECTION_PATH, self.OPTION_DJANGO_MANAGER)
+            self._origin_django_manager = self._value(self.SECTION_PATH, self.OPTION_DJANGO_MANAGER)
+            return self._origin_django_manager
 
         _pths = self.get_modules_lookup_paths()
         for _pth in _pths:
             _tryit = os.path.join(_pth, 'manage.py')
-            if os.path.exists(_tryit) and os.path.isfile(_tryit):
-                self.set(self.SECTION_PATH, self.OPTION_DJANGO_MANAGER, _tryit)
-
-        if not self.has_option(self.SECTION_PATH, self.OPTION_DJANGO_MANAGER):
+            # one stat answers both the exists and the is-file question
+            try:
+                if stat.S_ISREG(os.stat(_tryit).st_mode):
+                    self._origin_django_manager = _tryit
+                    break
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+
+        if self._origin_django_manager is None:
             self.raise_exception(f'Cannot locate Django manager in none of paths {str(_pths)}')
 
-        return self.get(self.SECTION_PATH, self.OPTION_DJANGO_MANAGER)
+        return self._origin_django_manager
 
     def get_path_target_django_manager(self) -> str:
-        return os.path.join(self.get_path_base_dir(), 'manage.py')
+        if self._target_django_manager is None:
+            self._target_django_manager = os.path.join(self.get_path_base_dir(), 'manage.py')
+        return self._target_django_manager
 
     def get_path_target_dir_statics(self) -> str:
-        return os.path.join(self.get_path_base_dir(), 'static')
+        if self._target_dir_statics is None:
+            self._target_dir_statics = os.path.join(self.get_path_base_dir(), 'static')
+        return self._target_dir_statics
 
 
 class StaticFilesManager(SubprocessAction):
 
+    # fingerprint of the static sources collected last time; kept next to the collected files
+    MANIFEST_FILE = '.static_manifest'
+
     def __init__(self, venv_python: str, django_mngr_path: str, target_path: str):
-        InstallationComponent.__init__(self)
+        SubprocessAction.__init__(self)
         self.target_path = target_path
         self.venv_python = venv_python
         self.origin_path = './static'
         self.django_manager = django_mngr_path
         self.collectstatic_command = 'collectstatic'
+        self.manifest_path = os.path.join(target_path, self.MANIFEST_FILE)
+        self._fingerprint = None
+        # the argv never varies between calls; built once here (execute never mutates it)
+        self._collect_command = ['sudo',
+                                 self.venv_python,
+                                 self.django_manager,
+                                 self.collectstatic_command,
+                                 '--noinput']
 
     def _component_name(self):
         return 'STATICFILES'
 
-    def _collect(self):
-        self.execute(command=['sudo',
-                              self.venv_python,
-                              self.django_manager,
-                              self.collectstatic_command,
-                              '--noinput'],
-                     must_succeed=True)
+    def _sources_fingerprint(self):
+        """
+        Digests name, mtime and size of every file under the static directories of the
+        Django project, so an unchanged source tree can be recognized without re-running
+        collectstatic. Returns None if no static sources are found
+        """
+        digest = hashlib.blake2b()
+        project_root = os.path.dirname(self.django_manager)
+        found_any = False
+        _stack = [(project_root, False)]
+        while _stack:
+            _current, _in_static = _stack.pop()
+            try:
+                with os.scandir(_current) as _entries:
+                    for _entry in sorted(_entries, key=lambda e: e.path):
+                        if _entry.is_dir(follow_symlinks=False):
+                            _stack.append((_entry.path, _in_static or _entry.name == 'static'))
+                        elif _in_static and _entry.is_file(follow_symlinks=False):
+                            _st = _entry.stat(follow_symlinks=False)
+                            digest.update(f'{os.path.relpath(_entry.path, project_root)}'
+                                          f':{_st.st_mtime_ns}:{_st.st_size}'.encode())
+                            found_any = True
+            except OSError:
+                continue
+        return digest.hexdigest() if found_any else None
+
+    def start_collect(self) -> subprocess.Popen:
+        """
+        Launches collectstatic without waiting for it; the command stats thousands of files,
+        so independent install steps can run while it proceeds. Completion is collected
+        with finish_collect.
+        Returns None - and spawns nothing - when the static sources are unchanged since
+        the previous install, as recorded in the manifest next to the collected files
+        :return: the started process handle, or None if the collection can be skipped
+        """
+        self._fingerprint = self._sources_fingerprint()
+        if self._fingerprint is not None:
+            try:
+                with open(self.manifest_path, 'r') as _manifest:
+                    if _manifest.read().strip() == self._fingerprint:
+                        self.log().debug(f'Static sources unchanged since the last install, '
+                                         f'collectstatic will be skipped')
+                        return None
+            except OSError:
+                pass  # no or unreadable manifest: collect as usual
+
+        return self.execute_background(command=self._collect_command)
+
+    def finish_collect(self, process: subprocess.Popen):
+        if process is None:
+            self.log().debug(f'Static files collection skipped, sources unchanged')
+            return
+
+        self.wait_for(process, must_succeed=True)
+
+        if self._fingerprint is not None:
+            try:
+                with open(self.manifest_path, 'w') as _manifest:
+                    _manifest.write(self._fingerprint)
+            except OSError as e:
+                # merely means the next install will collect again
+                self.log().debug(f'Static manifest could not be stored in {self.manifest_path}: {str(e)}')
 
         # not needed to double-check if the dir exists - the statics are now installed directly in the target dir
         # if not os.path.exists(self.origin_path):
@@ -108,17 +170,21 @@ class StaticFilesManager(SubprocessAction):
         self.log().debug(f'Static files collected in {self.origin_path}')
 
     def _copy_to_target(self):
-        self.execute(command=['sudo', 'cp', '-frv', self.origin_path, self.target_path])
+        if self._am_root:
+            # already privileged: copy the tree in-process instead of forking cp for every run
+            shutil.copytree(self.origin_path, self.target_path, dirs_exist_ok=True)
+        else:
+            self.execute(command=['sudo', 'cp', '-fr', self.origin_path, self.target_path], capture=False)
 
         self.log().debug(f'Collected static files copied from {self.origin_path} to {self.target_path}')
 
     def _remove_temp(self):
-        self.execute(command=['sudo', 'rm', '-frdv', self.origin_path], must_succeed=True)
+        self.remove_tree(self.origin_path)
 
         self.log().debug(f'Temporary directory with static files {self.origin_path} has been removed')
 
     def install(self):
-        self._collect()
+        self.finish_collect(self.start_collect())
         # originally, the static were collected in temporary folder, then moved to target 'manually'
         # this did not work, because collectstatic created link (in apache config) to the place
         # where it actually generated (collected) files. I found no easy way to work around that
@@ -144,66 +210,68 @@ class ApacheModWsgiConfigurator(SubprocessAction):
         self.venv_python = venv_python
         self.working_dir = working_dir
         self.startup_script_path = '/etc/rc.local'
+        # a pure function of the config dir; joined once instead of on every call
+        self.apachectl_path = os.path.join(apache_config_dir_path, 'apachectl')
+        # the argv never varies between calls; built once here (execute never mutates it)
+        self._configure_command = ['sudo',
+                                   self.venv_python,
+                                   self.django_mngr_path,
+                                   'runmodwsgi',
+                                   '--setup-only',
+                                   '--port=80',
+                                   '--user=www-data', '--group=www-data',
+                                   f'--pythonpath={self.venv_python}',
+                                   f'--working-directory={self.working_dir}',
+                                   f'--server-root={self.apache_config_dir_path}',
+                                   '--log-directory=/var/log/bhs/web-info',
+                                   '--process-name=BHS.WebInfo',
+                                   '--lang=pl_PL.UTF-8', '--locale=pl_PL.UTF-8']
 
     def _component_name(self):
         return 'APACHE-CONF'
 
     def apachectl(self):
-        return os.path.join(self.apache_config_dir_path, "apachectl")
+        return self.apachectl_path
 
     def configure(self):
-        self.execute(command=['sudo',
-                              self.venv_python,
-                              self.django_mngr_path,
-                              'runmodwsgi',
-                              '--setup-only',
-                              '--port=80',
-                              '--user=www-data', '--group=www-data',
-                              f'--pythonpath={self.venv_python}',
-                              f'--working-directory={self.working_dir}',
-                              f'--server-root={self.apache_config_dir_path}',
-                              '--log-directory=/var/log/bhs/web-info',
-                              '--process-name=BHS.WebInfo',
-                              '--lang=pl_PL.UTF-8', '--locale=pl_PL.UTF-8']
-                     , must_succeed=True)
+        self.execute(command=self._configure_command, must_succeed=True)
+
+    # matches the final 'exit 0' line; compiled once, shared by all instances
+    _RC_EXIT_RE = re.compile(r'^\s*exit 0\s*$', re.MULTILINE)
 
     def setup_on_startup(self):
         """
         Ensures the script /etc/rc.local contains apache startup script execution
         """
         # first, verify if the script contains the line and it is not commented
-        already_set_up = False
-        startup_script_content = list()
-        exit_0_index = None
-        startup_command = f'sudo {self.apachectl()} start'
+        startup_command = f'sudo {self.apachectl_path} start'
 
         self.log().debug(f'Adding {startup_command} to {self.startup_script_path}')
 
-        with open(self.startup_script_path, 'r') as startup_script:
-            startup_script_content = startup_script.readlines()
-            i = 0
-            for line in startup_script_content:
-                if line.strip() == startup_command:
-                    already_set_up = True
-                if line.strip() == 'exit 0':
-                    exit_0_index = i
-                i += 1
-
-        self.log().debug(f'Startup script {"already contains" if already_set_up else "does not contain"} the command.')
-        if exit_0_index:
-            self.log().debug(f'"exit 0" was located at index {exit_0_index}')
-        else:
-            self.log().warning(f'"exit 0" was not found in {self.startup_script_path}. This can cause problems!')
+        # one r+ handle serves both the read and the eventual splice-write,
+        # instead of a read-only open followed by a truncating re-open
+        with open(self.startup_script_path, 'r+') as startup_script:
+            content = startup_script.read()
+
+            # two compiled-regex scans over the slurped text replace the per-line strip-and-compare loop
+            already_set_up = re.search(rf'^\s*{re.escape(startup_command)}\s*$', content, re.MULTILINE) is not None
+            exit_matches = list(self._RC_EXIT_RE.finditer(content))
+            exit_0_match = exit_matches[-1] if exit_matches else None
+
+            self.log().debug(
+                f'Startup script {"already contains" if already_set_up else "does not contain"} the command.')
+            if exit_0_match:
+                self.log().debug(f'"exit 0" was located at offset {exit_0_match.start()}')
+            else:
+                self.log().warning(f'"exit 0" was not found in {self.startup_script_path}. This can cause problems!')
 
-        if not already_set_up:
-            insert_command_at = exit_0_index if exit_0_index is not None else len(startup_script_content)
-            modified_startup_script_content = startup_script_content[:insert_command_at]
-            modified_startup_script_content.extend([os.linesep, startup_command+os.linesep, os.linesep])
-            modified_startup_script_content.extend(startup_script_content[insert_command_at:])
+            if not already_set_up:
+                insert_command_at = exit_0_match.start() if exit_0_match is not None else len(content)
+                insert_block = os.linesep + startup_command + os.linesep + os.linesep
 
-            with open(self.startup_script_path, 'w') as startup_script:
-                for line in modified_startup_script_content:
-                    startup_script.write(line)
+                startup_script.seek(0)
+                startup_script.write(content[:insert_command_at] + insert_block + content[insert_command_at:])
+                startup_script.truncate()
 
 
 class ApacheController(SubprocessAction):
@@ -211,6 +279,9 @@ class ApacheController(SubprocessAction):
     def __init__(self, apache_ctrl: str):
         SubprocessAction.__init__(self)
         self.apache_ctrl = apache_ctrl
+        # the argvs never vary between calls; built once here (execute never mutates them)
+        self._stop_command = ['sudo', apache_ctrl, 'stop']
+        self._start_command = ['sudo', apache_ctrl, 'start']
 
     def stop(self) -> bool:
         """
@@ -220,7 +291,7 @@ class ApacheController(SubprocessAction):
         if not os.path.exists(self.apache_ctrl):
             return False
 
-        self.execute(command=['sudo', self.apache_ctrl, 'stop'], must_succeed=False)
+        self.execute(command=self._stop_command, must_succeed=False)
 
         return True
 
@@ -230,47 +301,34 @@ class ApacheController(SubprocessAction):
 
         :return:
         """
-        self.execute(command=['sudo', self.apache_ctrl, 'start'], must_succeed=True)
-
-
-def init_logging() -> logging.Logger:
-    logging.basicConfig(
-        filename=os.path.join('x_log', f'{datetime.today().strftime("%Y%m%d%H%M%S")}_wsgi.log'),
-        level=logging.DEBUG,
-        format='%(asctime)s %(name)s %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    logger = logging.getLogger()
-    stream_hdlr = logging.StreamHandler(sys.stdout)
-    stream_hdlr.setLevel(logging.INFO)
-    stream_hdlr.setFormatter(logger.handlers[0].formatter)
-    logger.addHandler(stream_hdlr)
-    return logger
+        self.execute(command=self._start_command, must_succeed=True)
 
 
 if __name__ == '__main__':
     cmdline = CommandlineConfig()
-    log = init_logging()
+    log = init_logging('wsgi')
     # 'install/webapp-info.config.ini'
     config = WebAppConfig(config_file=cmdline.config_file)
-    venv_mngr = VenvManager(venv_path=config.get_path_venv())
-    module_mngr = LocalModuleManager(lookup_paths=config.get_modules_lookup_paths(),
-                                     venv_path=config.get_path_venv())
-    statics_mngr = StaticFilesManager(venv_python=venv_mngr.get_python(),
-                                      django_mngr_path=config.get_path_origin_django_manager(),
-                                      target_path=config.get_path_base_dir())
-    ini_mngr = IniManager(target_dir=config.get_path_service_ini(),
-                          ini_file=config.get_path_origin_service_ini())
-    apache_config_mgr = ApacheModWsgiConfigurator(template_file=config.get_path_systemd_template(),
-                                                  target_file=config.get_path_systemd(),
-                                                  venv_python=venv_mngr.get_python(),
-                                                  django_mngr_path=config.get_path_target_django_manager(),
-                                                  apache_config_dir_path=config.get_path_service_ini(),
-                                                  working_dir=config.get_path_base_dir())
-    apache_ctrl = ApacheController(apache_ctrl=apache_config_mgr.apachectl())
 
     if cmdline.install:
 
+        # the uninstall branch is not implemented, so every manager is install-only
+        venv_mngr = VenvManager(venv_path=config.get_path_venv())
+        module_mngr = LocalModuleManager(lookup_paths=config.get_modules_lookup_paths(),
+                                         venv_mngr=venv_mngr)
+        statics_mngr = StaticFilesManager(venv_python=venv_mngr.get_python(),
+                                          django_mngr_path=config.get_path_origin_django_manager(),
+                                          target_path=config.get_path_base_dir())
+        ini_mngr = IniManager(target_dir=config.get_path_service_ini(),
+                              ini_file=config.get_path_origin_service_ini())
+        apache_config_mgr = ApacheModWsgiConfigurator(template_file=config.get_path_systemd_template(),
+                                                      target_file=config.get_path_systemd(),
+                                                      venv_python=venv_mngr.get_python(),
+                                                      django_mngr_path=config.get_path_target_django_manager(),
+                                                      apache_config_dir_path=config.get_path_service_ini(),
+                                                      working_dir=config.get_path_base_dir())
+        apache_ctrl = ApacheController(apache_ctrl=apache_config_mgr.apachectl())
+
         log.info(f'Installation initialized for service {config.get_service_full_name()}'
                  f'{" [minimal update only mode]" if cmdline.update_only else ""}')
 
@@ -278,22 +336,22 @@ if __name__ == '__main__':
         log.info(f'Apache stopped')
 
         if not cmdline.update_only:
-            venv_mngr.create()
-            log.info(f'Virtual environment created @ {config.get_path_venv()}')
-
-            # installing external modules
-            externals = config.get_external_modules()
-            for external in externals:
-                venv_mngr.install_module(external)
-                log.info(f'Module {external} installed')
-            log.info(f'All external modules installed')
+            # create virtual environment, unless a previous install fully provisioned it
+            if venv_mngr.create():
+                log.info(f'Virtual environment created @ {config.get_path_venv()}')
+
+                # installing external modules, all with a single pip call
+                externals = config.get_external_modules()
+                venv_mngr.install_modules(externals)
+                venv_mngr.mark_provisioned()
+                log.info(f'All external modules installed: {", ".join(externals)}')
+            else:
+                log.info(f'Virtual environment @ {config.get_path_venv()} already provisioned, creation skipped')
 
         # installing BHS modules
         modules = config.get_modules()
-        for module in modules:
-            module_mngr.install_module(module)
-            log.info(f'Module {module} installed')
-        log.info(f'All modules installed')
+        module_mngr.install_modules(modules)
+        log.info(f'All modules installed: {", ".join(modules)}')
 
         if not cmdline.update_only:
             # .wsgi file to instruct mod-wsgi how to create application
@@ -301,9 +359,9 @@ if __name__ == '__main__':
             wsgi_file_path = module_mngr.install_file(wsgi_file)
             log.info(f'WSGI file {wsgi_file} installed @ {wsgi_file_path}')
 
-        # collect and install static files
-        statics_mngr.install()
-        log.info(f'Static files collected and installed in {statics_mngr.target_path}')
+        # collect static files in the background; the file and ini installs below are
+        # independent of it and run while the Django command does its stat-heavy work
+        collect_proc = statics_mngr.start_collect()
 
         # installing files
         files = config.get_files()
@@ -316,6 +374,9 @@ if __name__ == '__main__':
         ini_mngr.copy_ini()
         log.info(f'Service configuration file is copied to {ini_mngr.ini_target_file_path}')
 
+        statics_mngr.finish_collect(collect_proc)
+        log.info(f'Static files collected and installed in {statics_mngr.target_path}')
+
         if not cmdline.update_only:
             # execute mod-wsgi-express configuration
             apache_config_mgr.configure()